@@ -1,23 +1,44 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from quart import Quart, Response, request
+from quart_cors import cors
 import os
 import logging
 import time
+import asyncio
+import orjson
+import msgspec
+import re
+import hashlib
+import threading
+from typing import Optional
+import numpy as np
 import google.generativeai as genai
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 # --- Setup ---
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+log = logging.getLogger(__name__)
 
-app = Flask(__name__)
-CORS(app)
+app = cors(Quart(__name__), expose_headers=["ETag"])
 
 # --- Gemini Model Setup ---
 model = None
 MODEL_NAME = 'models/gemini-1.5-flash-latest'
 MAX_TOKENS = 300
 TEMPERATURE = 0.7
+GENERATION_CONFIG = genai.types.GenerationConfig(
+    candidate_count=1,
+    max_output_tokens=MAX_TOKENS,
+    temperature=TEMPERATURE
+)
+# Used when the client asks for a deterministic reply (see ask()); such
+# replies carry an ETag the client can revalidate against.
+DETERMINISTIC_GENERATION_CONFIG = genai.types.GenerationConfig(
+    candidate_count=1,
+    max_output_tokens=MAX_TOKENS,
+    temperature=0
+)
 
 try:
     api_key = os.getenv("GEMINI_API_KEY")
@@ -25,27 +46,77 @@ try:
         raise EnvironmentError("GEMINI_API_KEY not found in environment variables.")
 
     genai.configure(api_key=api_key)
-    logging.info(f"Initializing Gemini model: {MODEL_NAME}")
+    log.info("Initializing Gemini model: %s", MODEL_NAME)
 
     model = genai.GenerativeModel(model_name=MODEL_NAME)
 
-    logging.info("Performing a quick test generation...")
-    test_prompt = "Say ok if you are working."
-    test_response = model.generate_content(
-        test_prompt,
-        generation_config=genai.types.GenerationConfig(candidate_count=1)
-    )
-    if test_response.candidates:
-        logging.info("Gemini model initialized successfully.")
-        logging.info(f"Sample response: {test_response.text[:80]}...")
-    else:
-        logging.warning("Model initialized, but test response was empty.")
-        logging.warning(f"Test Prompt Feedback: {getattr(test_response, 'prompt_feedback', 'N/A')}")
-
 except Exception as e:
-    logging.error(f"Model initialization failed: {e}")
+    log.error("Model initialization failed: %s", e)
     model = None
 
+# --- Response Cache ---
+# Exact-match cache for Gemini replies, keyed by the normalized message and
+# sampling mode. Set RESPONSE_CACHE_ENABLED=0 to always sample a fresh reply
+# from the model.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1024))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+
+response_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+response_cache_lock = threading.Lock()
+inflight_generations = {}
+
+def make_cache_key(message: str, deterministic: bool = False) -> tuple:
+    return (message.strip().lower(), deterministic)
+
+# --- Semantic Cache ---
+# Opt-in cache that also serves paraphrased questions: messages are embedded
+# and compared by cosine similarity against previously answered ones.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 1024))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+EMBEDDING_MODEL_NAME = 'models/text-embedding-004'
+
+# Fixed-size ring buffer: the vector matrix is allocated once on the first
+# store (when the embedding width is known) and slots are overwritten in place.
+semantic_vectors = None
+semantic_replies = [None] * SEMANTIC_CACHE_SIZE
+semantic_count = 0
+semantic_next = 0
+semantic_cache_lock = threading.Lock()
+
+async def embed_message(message: str):
+    result = await genai.embed_content_async(
+        model=EMBEDDING_MODEL_NAME,
+        content=message.strip(),
+        task_type="semantic_similarity"
+    )
+    vector = np.asarray(result["embedding"], dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def semantic_lookup(vector):
+    with semantic_cache_lock:
+        if semantic_count == 0:
+            return None
+        scores = semantic_vectors[:semantic_count] @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= SEMANTIC_CACHE_THRESHOLD:
+            log.info("Semantic cache hit (similarity %.3f).", scores[best])
+            return semantic_replies[best]
+    return None
+
+def semantic_store(vector, reply: str) -> None:
+    global semantic_vectors, semantic_count, semantic_next
+    with semantic_cache_lock:
+        if semantic_vectors is None:
+            semantic_vectors = np.empty((SEMANTIC_CACHE_SIZE, vector.shape[0]), dtype=np.float32)
+
+        # Once the buffer is full this overwrites the oldest entry.
+        semantic_vectors[semantic_next] = vector
+        semantic_replies[semantic_next] = reply
+        semantic_next = (semantic_next + 1) % SEMANTIC_CACHE_SIZE
+        semantic_count = min(semantic_count + 1, SEMANTIC_CACHE_SIZE)
+
 # --- Static Study Material Resource Dictionary ---
 study_resources = {
     "biology": [
@@ -74,103 +145,399 @@ study_resources = {
     ]
 }
 
-def get_resources_from_query(query: str) -> list:
-    matched_links = []
+# Lowercased keywords paired with frozen link tuples, computed once at import.
+STUDY_ITEMS = tuple(
+    (keyword.lower(), tuple(links)) for keyword, links in study_resources.items()
+)
+
+def build_keyword_pattern(keywords) -> str:
+    """Builds one regex alternation factored by shared prefixes (a trie), so
+    matching cost grows with keyword length rather than keyword count."""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = None  # marks the end of a keyword
+
+    def render(node) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + render(child) for char, child in node.items() if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not terminal:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        # The optional group is greedy, so longer keywords win over their prefixes.
+        return group + "?" if terminal else group
+
+    return render(trie)
+
+# The regex engine scans the query once against the keyword trie. Case folding
+# is ASCII-only so every match lowercases back to a dictionary key; Unicode
+# folding would also match variants such as a long s (U+017F) that .lower()
+# leaves unchanged.
+KEYWORD_PATTERN = re.compile(
+    r'\b(' + build_keyword_pattern(k for k, _ in STUDY_ITEMS) + r')\b',
+    re.IGNORECASE | re.ASCII
+)
+
+# Bullet-list block for each keyword, formatted once since the links are static.
+RESOURCES_HEADER = "\n\n📚 **Here are some potentially helpful resources:**\n"
+FORMATTED_RESOURCES = {
+    keyword: "".join(f"- {link}\n" for link in links) for keyword, links in STUDY_ITEMS
+}
+
+# Immutable module globals are bound as defaults below so the hot paths use
+# fast local lookups. `model` stays a global read so every route sees the same
+# client.
+def build_resources_suffix(query: str, _pattern=KEYWORD_PATTERN,
+                           _blocks=FORMATTED_RESOURCES, _log=log) -> str:
+    """Returns the resources section to append to a reply, or "" if no keyword matches."""
     if not query:
-        return matched_links
+        return ""
 
-    query_lower = query.lower()
-    logging.info(f"Checking for resource keywords in: '{query_lower}'")
-    found_keywords = set()
+    _log.info("Checking for resource keywords in: '%s'", query)
 
-    for keyword, links in study_resources.items():
-        if keyword in query_lower and keyword not in found_keywords:
-            logging.info(f"Keyword '{keyword}' found.")
-            matched_links.extend(links)
+    # Keyword detection and assembly happen in one pass over the matches,
+    # with a single join at the end. A repeated keyword is only listed once.
+    parts = [RESOURCES_HEADER]
+    found_keywords = set()
+    for match in _pattern.finditer(query):
+        keyword = match.group(1).lower()
+        if keyword not in found_keywords:
             found_keywords.add(keyword)
+            parts.append(_blocks[keyword])
 
-    logging.info(f"Found {len(matched_links)} resources for query.")
-    return matched_links
+    _log.info("Found %d resource keywords for query.", len(found_keywords))
+    return "".join(parts) if found_keywords else ""
 
-# --- Webhook Endpoint ---
-@app.route('/ask', methods=['POST'])
-def ask():
+# --- Gemini Generation ---
+async def generate_reply(user_message: str, deterministic: bool = False,
+                         _time=time.time, _log=log) -> tuple:
+    """Calls Gemini and returns (reply_text, succeeded)."""
+    gemini_reply = "Sorry, I couldn't process that request using the AI model."
+    try:
+        _log.info("Sending query to Gemini AI model '%s'...", MODEL_NAME)
+        start_time = _time()
+        response = await model.generate_content_async(
+            user_message,
+            generation_config=DETERMINISTIC_GENERATION_CONFIG if deterministic else GENERATION_CONFIG
+        )
+        duration = (_time() - start_time) * 1000
+        _log.info("Gemini response time: %.2f ms", duration)
+
+        if not response.candidates:
+            gemini_reply = "I couldn't generate a response, possibly due to content restrictions."
+            feedback = getattr(response, 'prompt_feedback', None)
+            if feedback and getattr(feedback, 'block_reason', None):
+                gemini_reply += f" (Reason: {feedback.block_reason.name})"
+            _log.warning("Empty response candidates from Gemini.")
+        else:
+            try:
+                gemini_reply = response.text.strip()
+                if _log.isEnabledFor(logging.INFO):
+                    _log.info("Gemini response: %s...", gemini_reply[:150])
+                return gemini_reply, True
+            except Exception as extract_e:
+                _log.error("Error extracting text from Gemini response: %s", extract_e)
+                gemini_reply = "Sorry, there was an issue reading the AI's response."
+
+    except Exception as gemini_e:
+        _log.error("Error calling Gemini API: %s", gemini_e)
+        gemini_reply = "Sorry, there was a technical problem contacting the AI assistant."
+
+    return gemini_reply, False
+
+async def generate_and_cache(user_message: str, deterministic: bool, cache_key: tuple) -> tuple:
+    # The semantic cache ignores sampling mode, so only non-deterministic
+    # messages use it.
+    vector = None
+    if SEMANTIC_CACHE_ENABLED and not deterministic:
+        try:
+            vector = await embed_message(user_message)
+            cached_reply = semantic_lookup(vector)
+            if cached_reply is not None:
+                # Repeats of this exact wording then skip the embedding call.
+                if RESPONSE_CACHE_ENABLED:
+                    with response_cache_lock:
+                        response_cache[cache_key] = cached_reply
+                return cached_reply, True
+        except Exception as embed_e:
+            log.error("Error during semantic cache lookup: %s", embed_e)
+            vector = None
+
+    gemini_reply, succeeded = await generate_reply(user_message, deterministic)
+    if succeeded and RESPONSE_CACHE_ENABLED:
+        with response_cache_lock:
+            response_cache[cache_key] = gemini_reply
+    if succeeded and vector is not None:
+        semantic_store(vector, gemini_reply)
+    return gemini_reply, succeeded
+
+def finish_generation(cache_key: tuple, task) -> None:
+    inflight_generations.pop(cache_key, None)
+    # Retrieve the exception so it is logged even if every waiter was cancelled.
+    if not task.cancelled() and task.exception() is not None:
+        log.error("In-flight Gemini generation failed: %s", task.exception())
+
+async def cached_generate(user_message: str, deterministic: bool = False) -> tuple:
+    """Returns (reply_text, succeeded), serving from cache where possible."""
+    cache_key = make_cache_key(user_message, deterministic)
+    if not RESPONSE_CACHE_ENABLED:
+        return await generate_and_cache(user_message, deterministic, cache_key)
+
+    with response_cache_lock:
+        cached_reply = response_cache.get(cache_key)
+    if cached_reply is not None:
+        log.info("Serving Gemini response from cache.")
+        return cached_reply, True
+
+    # Identical messages arriving while a Gemini call for the same key is in
+    # flight await that call instead of issuing their own.
+    pending = inflight_generations.get(cache_key)
+    if pending is not None:
+        log.info("Joining in-flight Gemini request for identical message.")
+        return await asyncio.shield(pending)
+
+    task = asyncio.ensure_future(generate_and_cache(user_message, deterministic, cache_key))
+    inflight_generations[cache_key] = task
+    # Drop the entry when the task itself finishes, not when this caller does,
+    # so identical requests keep joining it even if the first client goes away.
+    task.add_done_callback(lambda done: finish_generation(cache_key, done))
+    return await asyncio.shield(task)
+
+# The resources block is part of the /ask body, so editing study_resources
+# must invalidate ETags issued by a previous deploy.
+RESOURCES_DIGEST = hashlib.blake2b(
+    orjson.dumps(FORMATTED_RESOURCES, option=orjson.OPT_SORT_KEYS), digest_size=16
+).hexdigest()
+
+def make_etag(message: str) -> str:
+    normalized = f"{MODEL_NAME}\0{MAX_TOKENS}\0{RESOURCES_DIGEST}\0{message.strip().lower()}"
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+def with_etag(response: Response, etag: str) -> Response:
+    response.set_etag(etag)
+    return response
+
+def ojsonify(obj, status: int = 200) -> Response:
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+def sse_event(payload: dict) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+# --- Request Schema ---
+# Only the fields the webhook reads; msgspec validates them while decoding
+# and skips everything else in the Dialogflow payload.
+class QueryResult(msgspec.Struct):
+    queryText: Optional[str] = None
+
+class WebhookRequest(msgspec.Struct):
+    queryResult: QueryResult = msgspec.field(default_factory=QueryResult)
+
+# Reused across requests so the schema is resolved once, not per decode.
+webhook_decoder = msgspec.json.Decoder(WebhookRequest)
+
+def parse_query_text(raw_body: bytes):
+    """Returns queryResult.queryText from a Dialogflow payload, or raises msgspec.DecodeError."""
+    return webhook_decoder.decode(raw_body).queryResult.queryText
+
+async def read_user_message() -> tuple:
+    """Shared request prologue for /ask and /ask/stream.
+
+    Returns (user_message, None) when the request can be served, otherwise
+    (None, response) with the reply to send back as-is.
+    """
     if model is None:
-        logging.error("Model is not initialized, cannot process request.")
-        return jsonify({"fulfillmentText": "Sorry, the AI model connection is down."})
+        log.error("Model is not initialized, cannot process request.")
+        return None, ojsonify({"fulfillmentText": "Sorry, the AI model connection is down."})
 
     try:
-        req_data = request.get_json(silent=True)
-        if not req_data:
-            logging.error("Invalid or empty JSON received in request.")
-            return jsonify({"fulfillmentText": "Error: Invalid request received."}), 400
+        user_message = parse_query_text(await request.get_data())
+    except msgspec.DecodeError:
+        log.error("Invalid or empty JSON received in request.")
+        return None, ojsonify({"fulfillmentText": "Error: Invalid request received."}, 400)
 
-        user_message = req_data.get("queryResult", {}).get("queryText")
-        if not user_message:
-            logging.warning("No 'queryResult.queryText' found in request.")
-            return jsonify({"fulfillmentText": "I didn't receive a message to process."})
+    if not user_message:
+        log.warning("No 'queryResult.queryText' found in request.")
+        return None, ojsonify({"fulfillmentText": "I didn't receive a message to process."})
 
-        logging.info(f"Received user message: {user_message}")
+    log.info("Received user message: %s", user_message)
+    return user_message, None
 
-        # --- Step 1: Generate content from Gemini ---
-        gemini_reply = "Sorry, I couldn't process that request using the AI model."
-        try:
-            logging.info(f"Sending query to Gemini AI model '{MODEL_NAME}'...")
-            start_time = time.time()
-            response = model.generate_content(
-                user_message,
-                generation_config=genai.types.GenerationConfig(
-                    candidate_count=1,
-                    max_output_tokens=MAX_TOKENS,
-                    temperature=TEMPERATURE
-                )
-            )
-            duration = (time.time() - start_time) * 1000
-            logging.info(f"Gemini response time: {duration:.2f} ms")
-
-            if not response.candidates:
-                gemini_reply = "I couldn't generate a response, possibly due to content restrictions."
-                feedback = getattr(response, 'prompt_feedback', None)
-                if feedback and getattr(feedback, 'block_reason', None):
-                    gemini_reply += f" (Reason: {feedback.block_reason.name})"
-                logging.warning("Empty response candidates from Gemini.")
-            else:
-                try:
-                    gemini_reply = response.text.strip()
-                    logging.info(f"Gemini response: {gemini_reply[:150]}...")
-                except Exception as extract_e:
-                    logging.error(f"Error extracting text from Gemini response: {extract_e}")
-                    gemini_reply = "Sorry, there was an issue reading the AI's response."
+# --- Health Check ---
+# The test generation runs on first /healthz call (or in the background once
+# serving starts, unless SKIP_WARMUP=1) rather than at import, so startup does
+# not wait on a Gemini round trip. Only a successful probe is memoized;
+# concurrent callers share one in-flight probe, and after a failed probe the
+# failure is reported for HEALTH_REPROBE_INTERVAL seconds before retrying.
+HEALTH_REPROBE_INTERVAL = int(os.getenv("HEALTH_REPROBE_INTERVAL", 30))
+
+health_status = None
+health_probe = None
+last_probe_failure = None  # (monotonic time, status) of the latest failed probe
+
+async def run_probe() -> dict:
+    global health_status, last_probe_failure
+    try:
+        log.info("Performing a quick test generation...")
+        test_prompt = "Say ok if you are working."
+        test_response = await model.generate_content_async(
+            test_prompt,
+            generation_config=genai.types.GenerationConfig(candidate_count=1)
+        )
+        if test_response.candidates:
+            log.info("Gemini model initialized successfully.")
+            log.info("Sample response: %s...", test_response.text[:80])
+            health_status = {"status": "ok"}
+            return health_status
+
+        log.warning("Model initialized, but test response was empty.")
+        log.warning("Test Prompt Feedback: %s", getattr(test_response, 'prompt_feedback', 'N/A'))
+        status = {"status": "degraded"}
+    except Exception as e:
+        log.error("Gemini test generation failed: %s", e)
+        status = {"status": "error"}
+
+    last_probe_failure = (time.monotonic(), status)
+    return status
+
+def clear_health_probe(_task) -> None:
+    global health_probe
+    health_probe = None
+
+async def probe_model() -> dict:
+    global health_probe
+    if health_status is not None:
+        return health_status
+    if model is None:
+        return {"status": "down"}
+    if last_probe_failure and time.monotonic() - last_probe_failure[0] < HEALTH_REPROBE_INTERVAL:
+        return last_probe_failure[1]
+
+    if health_probe is None:
+        health_probe = asyncio.ensure_future(run_probe())
+        health_probe.add_done_callback(clear_health_probe)
+    return await asyncio.shield(health_probe)
+
+@app.before_serving
+async def warm_up():
+    if os.getenv("SKIP_WARMUP", "0") != "1":
+        app.add_background_task(probe_model)
+
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    status = await probe_model()
+    return ojsonify(status, 200 if status["status"] == "ok" else 503)
+
+# --- Webhook Endpoint ---
+@app.route('/ask', methods=['POST'])
+async def ask(_log=log, _generate=cached_generate,
+              _build_resources=build_resources_suffix):
+    try:
+        user_message, error_response = await read_user_message()
+        if error_response is not None:
+            return error_response
 
-        except Exception as gemini_e:
-            logging.error(f"Error calling Gemini API: {gemini_e}")
-            gemini_reply = "Sorry, there was a technical problem contacting the AI assistant."
+        # Clients that send X-Deterministic-Reply: 1 get a temperature-0 reply
+        # they can revalidate with If-None-Match. This is a POST, so a match is
+        # answered with 412 (RFC 9110 13.1.2) and the client keeps its copy.
+        deterministic = request.headers.get("X-Deterministic-Reply") == "1"
+        etag = None
+        if deterministic:
+            etag = make_etag(user_message)
+            if request.if_none_match.contains(etag):
+                _log.info("Client copy is current, returning 412.")
+                return with_etag(Response(status=412), etag)
+
+        # --- Step 1: Generate content from Gemini ---
+        gemini_reply, succeeded = await _generate(user_message, deterministic=deterministic)
 
         # --- Step 2: Append Study Resources ---
         final_reply = gemini_reply
         try:
-            resources = get_resources_from_query(user_message)
-            if resources:
-                resources_text = "\n\n📚 **Here are some potentially helpful resources:**\n"
-                for link in resources:
-                    resources_text += f"- {link}\n"
-                final_reply += resources_text
-                logging.info("Appended study resources to the response.")
+            resources_text = _build_resources(user_message)
+            if resources_text:
+                final_reply = gemini_reply + resources_text
+                _log.info("Appended study resources to the response.")
             else:
-                logging.info("No relevant study resources found for this query.")
+                _log.info("No relevant study resources found for this query.")
         except Exception as resource_e:
-            logging.error(f"Error occurred during resource lookup: {resource_e}")
+            _log.error("Error occurred during resource lookup: %s", resource_e)
 
         # --- Step 3: Return Combined Response ---
         fulfillment_response = {"fulfillmentText": final_reply}
-        logging.info(f"Sending final response to Dialogflow (first 200 chars): {final_reply[:200]}...")
-        return jsonify(fulfillment_response)
+        if _log.isEnabledFor(logging.INFO):
+            _log.info("Sending final response to Dialogflow (first 200 chars): %s...", final_reply[:200])
+        response = ojsonify(fulfillment_response)
+        if etag and succeeded:
+            with_etag(response, etag)
+        return response
 
     except Exception as e:
-        logging.error(f"Unexpected error in /ask route: {e}", exc_info=True)
-        return jsonify({"fulfillmentText": "An unexpected server error occurred."})
+        _log.error("Unexpected error in /ask route: %s", e, exc_info=True)
+        return ojsonify({"fulfillmentText": "An unexpected server error occurred."})
+
+# --- Streaming Endpoint ---
+# Same payload as /ask, but the reply is sent as server-sent events while
+# Gemini generates it: {"text": ...} chunks followed by a final
+# {"done": true, "resources": ...} event. Only the exact-match cache is used
+# here: a streamed reply cannot be shared with concurrent identical requests
+# the way /ask coalesces them, and the semantic cache is skipped so the first
+# token is not delayed by an embedding round trip.
+@app.route('/ask/stream', methods=['POST'])
+async def ask_stream():
+    user_message, error_response = await read_user_message()
+    if error_response is not None:
+        return error_response
+
+    async def events():
+        cache_key = make_cache_key(user_message)
+        cached_reply = None
+        if RESPONSE_CACHE_ENABLED:
+            with response_cache_lock:
+                cached_reply = response_cache.get(cache_key)
+
+        if cached_reply is not None:
+            log.info("Serving Gemini response from cache.")
+            yield sse_event({"text": cached_reply})
+        else:
+            chunks = []
+            try:
+                response = await model.generate_content_async(
+                    user_message,
+                    generation_config=GENERATION_CONFIG,
+                    stream=True
+                )
+                async for chunk in response:
+                    chunks.append(chunk.text)
+                    yield sse_event({"text": chunk.text})
+
+                if chunks and RESPONSE_CACHE_ENABLED:
+                    with response_cache_lock:
+                        response_cache[cache_key] = "".join(chunks).strip()
+            except Exception as gemini_e:
+                log.error("Error streaming from Gemini API: %s", gemini_e)
+                yield sse_event({"error": "Sorry, there was a technical problem contacting the AI assistant."})
+
+        resources = ""
+        try:
+            resources = build_resources_suffix(user_message)
+        except Exception as resource_e:
+            log.error("Error occurred during resource lookup: %s", resource_e)
+        yield sse_event({"done": True, "resources": resources})
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.timeout = None
+    return response
 
 # --- App Runner ---
+# For local testing only; in production run `gunicorn app:app`, which picks up
+# gunicorn.conf.py and serves the app with uvicorn workers.
 if __name__ == '__main__':
     port = int(os.getenv("PORT", 5001))
-    app.run(debug=True, host='0.0.0.0', port=port)
+    # The reloader would re-import this module in a child process; keep it off.
+    debug = os.getenv("FLASK_DEBUG", "0") == "1"
+    app.run(debug=debug, use_reloader=False, host='0.0.0.0', port=port)
@@ -0,0 +1,9 @@
+# Gunicorn settings, picked up automatically by `gunicorn app:app`.
+# The app is ASGI (Quart), so each worker runs a uvicorn event loop; a single
+# worker already overlaps many in-flight Gemini requests.
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5001)}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))